@@ -1,11 +1,11 @@
 from __future__ import annotations
 
-from functools import lru_cache
+from functools import cached_property, lru_cache
 import os
 from pathlib import Path
 from typing import Literal
 
-from pydantic import Field, model_validator
+from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -35,14 +35,16 @@ class Settings(BaseSettings):
     local_xlsx_path: str | None = Field(default=None, alias="LOCAL_XLSX_PATH")
     static_root: str | None = Field(default=None, alias="STATIC_ROOT")
     catalog_cache_ttl_seconds: int = Field(default=120, alias="CATALOG_CACHE_TTL_SECONDS")
+    # Embedded images larger than this (uncompressed) are skipped instead of decoded; 0 disables.
+    max_image_bytes: int = Field(default=25 * 1024 * 1024, alias="MAX_IMAGE_BYTES")
 
     allowed_origins: str = Field(default="http://localhost:5173", alias="ALLOWED_ORIGINS")
 
-    @property
+    @cached_property
     def base_dir(self) -> Path:
         return Path(__file__).resolve().parents[1]
 
-    @property
+    @cached_property
     def static_dir(self) -> Path:
         # Vercel serverless file system is read-only except /tmp.
         if self.static_root:
@@ -51,7 +53,7 @@ class Settings(BaseSettings):
             return Path("/tmp/static")
         return self.base_dir / "static"
 
-    @property
+    @cached_property
     def media_dir(self) -> Path:
         return self.static_dir / "media"
 
@@ -63,14 +65,18 @@ class Settings(BaseSettings):
     def effective_item_id(self) -> str | None:
         return self.ms_item_id or self.graph_item_id
 
-    @property
-    def allowed_origins_list(self) -> list[str]:
+    @cached_property
+    def allowed_origins_list(self) -> tuple[str, ...]:
         origins: list[str] = []
         for origin in self.allowed_origins.split(","):
             normalized_origin = origin.strip().rstrip("/")
             if normalized_origin:
                 origins.append(normalized_origin)
-        return origins
+        return tuple(origins)
+
+    @cached_property
+    def allowed_origins_set(self) -> frozenset[str]:
+        return frozenset(self.allowed_origins_list)
 
     def graph_missing_config_fields(self) -> list[str]:
         missing: list[str] = []
@@ -88,18 +94,19 @@ class Settings(BaseSettings):
 
         return missing
 
-    @model_validator(mode="after")
-    def validate_workbook_source(self) -> "Settings":
-        if self.source_mode == "local":
-            if not self.local_xlsx_path:
-                raise ValueError("LOCAL_XLSX_PATH is required when SOURCE_MODE=local.")
-            return self
 
-        # Graph config is validated by the health endpoint/runtime path so
-        # server startup remains resilient with partial configuration.
-        return self
+def _validate_workbook_source(settings: Settings) -> None:
+    # Checked once in get_settings() rather than as a model validator compiled
+    # into the Settings schema.
+    if settings.source_mode == "local" and not settings.local_xlsx_path:
+        raise ValueError("LOCAL_XLSX_PATH is required when SOURCE_MODE=local.")
+
+    # Graph config is validated by the health endpoint/runtime path so
+    # server startup remains resilient with partial configuration.
 
 
 @lru_cache
 def get_settings() -> Settings:
-    return Settings()
+    settings = Settings()
+    _validate_workbook_source(settings)
+    return settings
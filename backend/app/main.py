@@ -1,16 +1,23 @@
 from __future__ import annotations
 
 import asyncio
-import json
+import hashlib
+import itertools
 import logging
+import os
+import secrets
+import tempfile
 import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from dataclasses import dataclass
-from uuid import uuid4
+from functools import lru_cache
+from pathlib import Path
 
+import orjson
 from fastapi import FastAPI, HTTPException, Query, Request, Response
-from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from starlette.middleware.base import BaseHTTPMiddleware
 
 from app.config import get_settings
 from app.models import CatalogResponse
@@ -20,22 +27,40 @@ from app.services.graph_client import GraphClient
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
-settings.static_dir.mkdir(parents=True, exist_ok=True)
-settings.media_dir.mkdir(parents=True, exist_ok=True)
 
-app = FastAPI(title="Artwork Viewer API")
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    # Created at startup rather than import; media_dir sits under static_dir, so
+    # one check covers both and a warm serverless container skips the mkdir.
+    if not settings.media_dir.is_dir():
+        settings.media_dir.mkdir(parents=True, exist_ok=True)
+    yield
+    # Only close a Graph client that was actually created; don't build one here.
+    if get_graph_client.cache_info().currsize:
+        graph_client = get_graph_client()
+        if graph_client is not None:
+            await graph_client.aclose()
+
+
+app = FastAPI(title="Artwork Viewer API", lifespan=lifespan)
 
 
 def log_json(event: str, **fields: object) -> None:
+    # Skip building and serializing the payload when INFO logging is off.
+    if not logger.isEnabledFor(logging.INFO):
+        return
     payload = {"event": event, **fields}
-    logger.info(json.dumps(payload, separators=(",", ":"), default=str))
+    logger.info(orjson.dumps(payload, default=str).decode("utf-8"))
 
 
 @dataclass
 class CatalogCacheEntry:
     key: str
-    expires_at: float
+    expires_at_ns: int
     response: CatalogResponse
+    response_bytes: bytes
+    etag: str
     workbook_source: str
     workbook_identity: str
     extraction_ms: int
@@ -44,191 +69,260 @@ class CatalogCacheEntry:
 
 
 catalog_cache_entry: CatalogCacheEntry | None = None
-catalog_cache_lock = asyncio.Lock()
-allowed_origins = frozenset(settings.allowed_origins_list)
-
-
-class RequestContextMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        request_id = str(uuid4())
-        request.state.request_id = request_id
-        response = await call_next(request)
-        response.headers["X-Request-Id"] = request_id
-        return response
-
+# Single-flight catalog build shared by concurrent cache misses.
+catalog_build_task: asyncio.Task[CatalogCacheEntry] | None = None
+# Whether the in-flight build was started by refresh=1 (and so skips catalog reuse).
+catalog_build_forced = False
+
+
+# Request ids only need to be unique, not unpredictable: a per-process random
+# prefix plus a counter avoids a urandom read and UUID formatting per request.
+REQUEST_ID_PREFIX = f"{secrets.token_hex(4)}-{os.getpid():x}"
+request_id_counter = itertools.count(1)
+request_id_ctx: ContextVar[str] = ContextVar("request_id", default="")
+PREFLIGHT_BODY = {"type": "http.response.body", "body": b""}
+VARY_ORIGIN_HEADER = (b"vary", b"Origin")
+# Same reply Starlette's CORSMiddleware gave a preflight from an origin not in ALLOWED_ORIGINS.
+DISALLOWED_PREFLIGHT_BODY = b"Disallowed CORS origin"
+DISALLOWED_PREFLIGHT_RESPONSE = {
+    "type": "http.response.start",
+    "status": 400,
+    "headers": [
+        (b"content-type", b"text/plain; charset=utf-8"),
+        (b"content-length", str(len(DISALLOWED_PREFLIGHT_BODY)).encode("latin-1")),
+        VARY_ORIGIN_HEADER,
+    ],
+}
+
+
+class RequestContextCORSMiddleware:
+    """Raw ASGI middleware that stamps request ids and applies CORS in one pass."""
 
-class ForceCORSMiddleware(BaseHTTPMiddleware):
     def __init__(self, app, allowed: frozenset[str]) -> None:
-        super().__init__(app)
-        self.allowed_origins = allowed
+        self.app = app
+        # Keyed by the raw Origin header bytes (with or without a trailing slash),
+        # so requests never decode or strip. Header lists and preflight replies
+        # are identical per origin and built once here.
+        self.cors_headers: dict[bytes, list[tuple[bytes, bytes]]] = {}
+        self.preflight_responses: dict[bytes, dict[str, object]] = {}
+        for origin in allowed:
+            origin_bytes = origin.encode("latin-1")
+            cors_headers = [
+                (b"access-control-allow-origin", origin_bytes),
+                (b"access-control-allow-credentials", b"true"),
+                (b"access-control-allow-methods", b"*"),
+                (b"access-control-allow-headers", b"*"),
+            ]
+            preflight_response = {
+                "type": "http.response.start",
+                "status": 204,
+                "headers": [*cors_headers, VARY_ORIGIN_HEADER, (b"content-length", b"0")],
+            }
+            for raw_origin in (origin_bytes, origin_bytes + b"/"):
+                self.cors_headers[raw_origin] = cors_headers
+                self.preflight_responses[raw_origin] = preflight_response
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        raw_origin: bytes | None = None
+        has_request_method = False
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                raw_origin = value
+            elif name == b"access-control-request-method":
+                has_request_method = True
+
+        # Only a real preflight (Origin + Access-Control-Request-Method) is answered
+        # here. Any other OPTIONS request, even from an allowed origin, goes to the
+        # router and gets its 405 (the old ForceCORSMiddleware answered those 204).
+        if scope["method"] == "OPTIONS" and raw_origin is not None and has_request_method:
+            preflight_response = self.preflight_responses.get(raw_origin)
+            if preflight_response is None:
+                await send(DISALLOWED_PREFLIGHT_RESPONSE)
+                await send({"type": "http.response.body", "body": DISALLOWED_PREFLIGHT_BODY})
+            else:
+                await send(preflight_response)
+                await send(PREFLIGHT_BODY)
+            return
+
+        request_id = f"{REQUEST_ID_PREFIX}-{next(request_id_counter):x}"
+        request_id_ctx.set(request_id)
+        # Vary: Origin goes on every response, allowed origin or not, so shared
+        # caches never hand a response without CORS headers to the frontend.
+        extra_headers = [
+            (b"x-request-id", request_id.encode("latin-1")),
+            VARY_ORIGIN_HEADER,
+            *self.cors_headers.get(raw_origin or b"", ()),
+        ]
+
+        async def send_with_headers(message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), *extra_headers]
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
 
-    async def dispatch(self, request: Request, call_next):
-        request_origin = request.headers.get("origin", "").strip().rstrip("/")
-        is_allowed_origin = request_origin in self.allowed_origins
 
-        if request.method == "OPTIONS" and is_allowed_origin:
-            response = Response(status_code=204)
-        else:
-            response = await call_next(request)
+def _catalog_cache_key(identity: str) -> str:
+    return f"{settings.source_mode}:{identity}"
 
-        if is_allowed_origin:
-            response.headers["Access-Control-Allow-Origin"] = request_origin
-            response.headers["Vary"] = "Origin"
-            response.headers["Access-Control-Allow-Credentials"] = "true"
-            response.headers["Access-Control-Allow-Methods"] = "*"
-            response.headers["Access-Control-Allow-Headers"] = "*"
 
-        return response
+def _elapsed_ms(started_ns: int) -> int:
+    return (time.monotonic_ns() - started_ns) // 1_000_000
 
 
-def _catalog_cache_key(identity: str) -> str:
-    return f"{settings.source_mode}:{identity}"
+def _is_cache_entry_fresh(entry: CatalogCacheEntry | None, key: str, now_ns: int) -> bool:
+    return entry is not None and entry.key == key and entry.expires_at_ns > now_ns
 
 
-def _sum_images(categories: list[dict[str, object]]) -> int:
-    return sum(int(category.get("images_count", 0)) for category in categories)
+def _log_catalog_hit(
+    entry: CatalogCacheEntry,
+    request: Request,
+    request_id: str,
+    request_started_ns: int,
+) -> None:
+    total_ms = _elapsed_ms(request_started_ns)
+    log_json(
+        "catalog_request",
+        request_id=request_id,
+        path=request.url.path,
+        method=request.method,
+        source_mode=settings.source_mode,
+        workbook_source=entry.workbook_source,
+        workbook_identity=entry.workbook_identity,
+        categories=len(entry.response["categories"]),
+        total_images=entry.total_images,
+        per_category=entry.category_stats,
+        extraction_ms=0,
+        total_ms=total_ms,
+        cache_status="HIT",
+    )
 
 
 def _as_catalog_response(build_result: CatalogBuildResult) -> CatalogResponse:
-    return CatalogResponse(categories=build_result.categories)
+    # Categories come from CatalogService (trusted internal producer) and already
+    # have the Category shape, so they are passed through without validation.
+    return {"categories": build_result.categories}
+
 
+def _catalog_json_response(entry: CatalogCacheEntry, cache_status: str, if_none_match: str) -> Response:
+    # Serialized once per cache fill; HITs only write the cached bytes.
+    headers = {
+        # Conservative cache headers for browser/CDN to reduce repeated fetch pressure.
+        "Cache-Control": "private, max-age=10",
+        "CDN-Cache-Control": "max-age=60",
+        "ETag": entry.etag,
+        "X-Catalog-Cache": cache_status,
+    }
+    if if_none_match and if_none_match == entry.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.response_bytes, media_type="application/json", headers=headers)
 
-app.add_middleware(RequestContextMiddleware)
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=settings.allowed_origins_list,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-app.add_middleware(ForceCORSMiddleware, allowed=allowed_origins)
 
-app.mount("/static", StaticFiles(directory=settings.static_dir), name="static")
+app.add_middleware(RequestContextCORSMiddleware, allowed=settings.allowed_origins_set)
+
+app.mount("/static", StaticFiles(directory=settings.static_dir, check_dir=False), name="static")
 # Keep a prefixed static mount for serverless platforms that preserve `/api` in the path.
-app.mount("/api/static", StaticFiles(directory=settings.static_dir), name="api-static")
+app.mount("/api/static", StaticFiles(directory=settings.static_dir, check_dir=False), name="api-static")
+
+
+@lru_cache
+def get_graph_client() -> GraphClient | None:
+    # Built on first use so cold starts that never reach Graph skip it.
+    return GraphClient(settings=settings) if settings.source_mode == "graph" else None
+
+
+catalog_service = CatalogService(settings=settings, graph_client_factory=get_graph_client)
+
 
-graph_client = GraphClient(settings=settings) if settings.source_mode == "graph" else None
-catalog_service = CatalogService(settings=settings, graph_client=graph_client)
+async def _build_catalog_entry(cache_ttl: int, force: bool) -> CatalogCacheEntry:
+    global catalog_cache_entry, catalog_build_task
+
+    try:
+        build_result = await catalog_service.build_catalog_result(force=force)
+        catalog_response = _as_catalog_response(build_result)
+        # Serialized once per build; hits and 304s reuse these bytes.
+        response_bytes = orjson.dumps(catalog_response)
+        entry = CatalogCacheEntry(
+            key=_catalog_cache_key(build_result.workbook_identity),
+            expires_at_ns=time.monotonic_ns() + cache_ttl * 1_000_000_000,
+            response=catalog_response,
+            response_bytes=response_bytes,
+            etag=f'"{hashlib.blake2b(response_bytes, digest_size=16).hexdigest()}"',
+            workbook_source=build_result.workbook_source,
+            workbook_identity=build_result.workbook_identity,
+            extraction_ms=build_result.extraction_ms,
+            total_images=build_result.total_images,
+            category_stats=build_result.category_stats,
+        )
+        catalog_cache_entry = entry if cache_ttl > 0 else None
+        return entry
+    finally:
+        catalog_build_task = None
 
 
-@app.get("/catalog", response_model=CatalogResponse)
-@app.get("/api/catalog", response_model=CatalogResponse, include_in_schema=False)
+@app.get("/catalog", response_model=None, responses={200: {"model": CatalogResponse}})
+@app.get("/api/catalog", response_model=None, include_in_schema=False)
 async def get_catalog(
     request: Request,
-    response: Response,
     refresh: int = Query(default=0),
-) -> CatalogResponse:
-    global catalog_cache_entry
+) -> Response:
+    global catalog_build_task, catalog_build_forced
 
-    request_started = time.perf_counter()
-    request_id = getattr(request.state, "request_id", "")
+    request_started_ns = time.monotonic_ns()
+    request_id = request_id_ctx.get()
+    if_none_match = request.headers.get("if-none-match", "").strip()
     force_refresh = refresh == 1
     cache_ttl = max(settings.catalog_cache_ttl_seconds, 0)
-    cache_status = "MISS"
-
-    # Conservative cache headers for browser/CDN to reduce repeated fetch pressure.
-    response.headers["Cache-Control"] = "private, max-age=10"
-    response.headers["CDN-Cache-Control"] = "max-age=60"
-
-    peek_identity = catalog_service.peek_workbook_identity()
-    peek_key = _catalog_cache_key(peek_identity)
-    now = time.time()
-
-    if not force_refresh and cache_ttl > 0 and catalog_cache_entry:
-        if catalog_cache_entry.key == peek_key and catalog_cache_entry.expires_at > now:
-            cache_status = "HIT"
-            response.headers["X-Catalog-Cache"] = cache_status
-            total_ms = int((time.perf_counter() - request_started) * 1000)
-            log_json(
-                "catalog_request",
-                request_id=request_id,
-                path=request.url.path,
-                method=request.method,
-                source_mode=settings.source_mode,
-                workbook_source=catalog_cache_entry.workbook_source,
-                workbook_identity=catalog_cache_entry.workbook_identity,
-                categories=len(catalog_cache_entry.response.categories),
-                total_images=catalog_cache_entry.total_images,
-                per_category=catalog_cache_entry.category_stats,
-                extraction_ms=0,
-                total_ms=total_ms,
-                cache_status=cache_status,
-            )
-            return catalog_cache_entry.response
-
-    async with catalog_cache_lock:
-        now = time.time()
-        peek_identity = catalog_service.peek_workbook_identity()
-        peek_key = _catalog_cache_key(peek_identity)
-
-        if (
-            not force_refresh
-            and cache_ttl > 0
-            and catalog_cache_entry
-            and catalog_cache_entry.key == peek_key
-            and catalog_cache_entry.expires_at > now
-        ):
-            cache_status = "HIT"
-            response.headers["X-Catalog-Cache"] = cache_status
-            total_ms = int((time.perf_counter() - request_started) * 1000)
-            log_json(
-                "catalog_request",
-                request_id=request_id,
-                path=request.url.path,
-                method=request.method,
-                source_mode=settings.source_mode,
-                workbook_source=catalog_cache_entry.workbook_source,
-                workbook_identity=catalog_cache_entry.workbook_identity,
-                categories=len(catalog_cache_entry.response.categories),
-                total_images=catalog_cache_entry.total_images,
-                per_category=catalog_cache_entry.category_stats,
-                extraction_ms=0,
-                total_ms=total_ms,
-                cache_status=cache_status,
-            )
-            return catalog_cache_entry.response
+    use_cache = not force_refresh and cache_ttl > 0
+
+    # stat() (plus a 64 KiB hash in Graph mode after a new download): keep it off the loop.
+    peek_key = _catalog_cache_key(await asyncio.to_thread(catalog_service.peek_workbook_identity))
+
+    cached_entry = catalog_cache_entry
+    if use_cache and _is_cache_entry_fresh(cached_entry, peek_key, request_started_ns):
+        _log_catalog_hit(cached_entry, request, request_id, request_started_ns)
+        return _catalog_json_response(cached_entry, "HIT", if_none_match)
+
+    # Concurrent misses await the same in-flight build instead of queueing
+    # up to build the catalog one after another.
+    build_task = catalog_build_task
+    # A plain build may reuse the previous catalog, so refresh=1 waits it out
+    # and starts a forced build rather than joining it.
+    while build_task is not None and force_refresh and not catalog_build_forced:
+        await asyncio.wait((build_task,))
+        build_task = catalog_build_task
+    if build_task is None:
+        build_task = asyncio.ensure_future(_build_catalog_entry(cache_ttl, force_refresh))
+        catalog_build_task = build_task
+        catalog_build_forced = force_refresh
 
-        try:
-            build_result = await catalog_service.build_catalog_result()
-            catalog_response = _as_catalog_response(build_result)
-        except Exception as exc:
-            raise HTTPException(status_code=500, detail=f"Catalog generation failed: {exc}") from exc
-
-        response.headers["X-Catalog-Cache"] = "BYPASS" if force_refresh else "MISS"
-        cache_status = response.headers["X-Catalog-Cache"]
-        key = _catalog_cache_key(build_result.workbook_identity)
-
-        if cache_ttl > 0:
-            catalog_cache_entry = CatalogCacheEntry(
-                key=key,
-                expires_at=time.time() + cache_ttl,
-                response=catalog_response,
-                workbook_source=build_result.workbook_source,
-                workbook_identity=build_result.workbook_identity,
-                extraction_ms=build_result.extraction_ms,
-                total_images=build_result.total_images,
-                category_stats=build_result.category_stats,
-            )
-        else:
-            catalog_cache_entry = None
-
-        total_ms = int((time.perf_counter() - request_started) * 1000)
-        log_json(
-            "catalog_request",
-            request_id=request_id,
-            path=request.url.path,
-            method=request.method,
-            source_mode=settings.source_mode,
-            workbook_source=build_result.workbook_source,
-            workbook_identity=build_result.workbook_identity,
-            categories=len(catalog_response.categories),
-            total_images=_sum_images(build_result.categories),
-            per_category=build_result.category_stats,
-            extraction_ms=build_result.extraction_ms,
-            total_ms=total_ms,
-            cache_status=cache_status,
-        )
-        return catalog_response
+    try:
+        entry = await asyncio.shield(build_task)
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Catalog generation failed: {exc}") from exc
+
+    cache_status = "BYPASS" if force_refresh else "MISS"
+    total_ms = _elapsed_ms(request_started_ns)
+    log_json(
+        "catalog_request",
+        request_id=request_id,
+        path=request.url.path,
+        method=request.method,
+        source_mode=settings.source_mode,
+        workbook_source=entry.workbook_source,
+        workbook_identity=entry.workbook_identity,
+        categories=len(entry.response["categories"]),
+        total_images=entry.total_images,
+        per_category=entry.category_stats,
+        extraction_ms=entry.extraction_ms,
+        total_ms=total_ms,
+        cache_status=cache_status,
+    )
+    return _catalog_json_response(entry, cache_status, if_none_match)
 
 
 @app.get("/health/graph")
@@ -242,10 +336,17 @@ async def graph_health() -> dict[str, object]:
         return {"mode": "graph", "status": "missing_config", "missing": missing}
 
     try:
+        graph_client = get_graph_client()
         if graph_client is None:
             return {"mode": "graph", "status": "error", "error": "Graph client is not configured."}
-        workbook_bytes = await graph_client.download_excel_file()
-        return {"mode": "graph", "status": "ok", "bytes": len(workbook_bytes)}
+        # Each probe downloads unconditionally to its own scratch file, so it never
+        # touches the cached workbook or races a concurrent probe's cleanup.
+        scratch_path = Path(tempfile.gettempdir()) / f"artwork_graph_health_{secrets.token_hex(8)}.xlsx"
+        try:
+            workbook_size = await graph_client.download_excel_file(scratch_path, conditional=False)
+        finally:
+            await asyncio.to_thread(scratch_path.unlink, missing_ok=True)
+        return {"mode": "graph", "status": "ok", "bytes": workbook_size}
     except Exception as exc:
         return {"mode": "graph", "status": "error", "error": str(exc)}
 
@@ -253,64 +354,54 @@ async def graph_health() -> dict[str, object]:
 @app.get("/media/{category}/{filename}")
 @app.get("/api/media/{category}/{filename}", include_in_schema=False)
 async def get_media(category: str, filename: str, request: Request) -> Response:
-    request_started = time.perf_counter()
-    request_id = getattr(request.state, "request_id", "")
-    if_none_match = request.headers.get("if-none-match", "").strip()
+    request_started_ns = time.monotonic_ns()
+    request_id = request_id_ctx.get()
 
     try:
         media_result = await catalog_service.get_media_image(category=category, filename=filename)
-        headers = {
-            "Cache-Control": "public, max-age=31536000, immutable",
-            "ETag": media_result.etag,
-        }
-
-        if if_none_match and if_none_match == media_result.etag:
-            response = Response(status_code=304, headers=headers)
-        else:
-            response = Response(content=media_result.content, media_type="image/png", headers=headers)
-
-        total_ms = int((time.perf_counter() - request_started) * 1000)
-        log_json(
-            "media_request",
-            request_id=request_id,
-            path=request.url.path,
-            method=request.method,
-            source_mode=settings.source_mode,
-            workbook_source=media_result.workbook_source,
-            workbook_identity=media_result.workbook_identity,
-            category=category,
-            filename=filename,
-            cache_hit=media_result.cache_hit,
-            status_code=response.status_code,
-            total_ms=total_ms,
-        )
-        return response
     except FileNotFoundError:
-        total_ms = int((time.perf_counter() - request_started) * 1000)
+        # Common for probing clients; keep the error log line small.
         log_json(
             "media_request",
             request_id=request_id,
             path=request.url.path,
-            method=request.method,
-            source_mode=settings.source_mode,
-            category=category,
-            filename=filename,
             status_code=404,
-            total_ms=total_ms,
+            total_ms=_elapsed_ms(request_started_ns),
         )
         raise HTTPException(status_code=404, detail="Media not found.")
     except Exception as exc:
-        total_ms = int((time.perf_counter() - request_started) * 1000)
         log_json(
             "media_request",
             request_id=request_id,
             path=request.url.path,
-            method=request.method,
-            source_mode=settings.source_mode,
-            category=category,
-            filename=filename,
             status_code=500,
-            total_ms=total_ms,
+            total_ms=_elapsed_ms(request_started_ns),
             error=str(exc),
         )
         raise HTTPException(status_code=500, detail=f"Media retrieval failed: {exc}") from exc
+
+    headers = {
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "ETag": media_result.etag,
+    }
+    if_none_match = request.headers.get("if-none-match", "").strip()
+    if if_none_match and if_none_match == media_result.etag:
+        response = Response(status_code=304, headers=headers)
+    else:
+        response = Response(content=media_result.content, media_type=media_result.media_type, headers=headers)
+
+    log_json(
+        "media_request",
+        request_id=request_id,
+        path=request.url.path,
+        method=request.method,
+        source_mode=settings.source_mode,
+        workbook_source=media_result.workbook_source,
+        workbook_identity=media_result.workbook_identity,
+        category=category,
+        filename=filename,
+        cache_hit=media_result.cache_hit,
+        status_code=response.status_code,
+        total_ms=_elapsed_ms(request_started_ns),
+    )
+    return response
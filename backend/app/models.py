@@ -1,13 +1,13 @@
-from pydantic import BaseModel
+from typing_extensions import NotRequired, TypedDict
 
 
-class Category(BaseModel):
+class Category(TypedDict):
     name: str
     images: list[str]
-    images_count: int = 0
-    unsupported_objects_detected: bool = False
-    notes: str | None = None
+    images_count: NotRequired[int]
+    unsupported_objects_detected: NotRequired[bool]
+    notes: NotRequired[str | None]
 
 
-class CatalogResponse(BaseModel):
+class CatalogResponse(TypedDict):
     categories: list[Category]
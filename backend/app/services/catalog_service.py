@@ -1,32 +1,51 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
 import posixpath
 import re
+import string
 import tempfile
+import threading
 import time
 import hashlib
 import json
-import xml.etree.ElementTree as ET
-from dataclasses import dataclass
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from functools import lru_cache
 from io import BytesIO
 from pathlib import Path
-from urllib.parse import quote
+from stat import S_ISREG
+from typing import IO
 from zipfile import ZipFile
 
-from openpyxl import load_workbook
+from lxml import etree as ET
 from PIL import Image
 
 from app.config import Settings
+from app.models import Category
 from app.services.graph_client import GraphClient
 
 
 INVALID_DIR_CHARS = re.compile(r"[^A-Za-z0-9._-]+")
 DEFAULT_SHEET_PATTERN = re.compile(r"^Sheet\d*$", re.IGNORECASE)
-SAFE_CATEGORY_PATTERN = re.compile(r"^[A-Za-z0-9._-]+$")
-MEDIA_CACHE_FILE_PATTERN = re.compile(r"^img_\d+\.(png|meta)$")
+SAFE_CATEGORY_CHARS = frozenset(string.ascii_letters + string.digits + "._-")
+MEDIA_CACHE_FILE_SUFFIXES = (".png", ".jpg", ".meta")
 GRAPH_SIGNATURE_BYTES = 65536
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+JPEG_SIGNATURE = b"\xff\xd8\xff"
+# JPEG sources are served as-is; everything else is served as PNG.
+MEDIA_TYPES_BY_SUFFIX = {".png": "image/png", ".jpg": "image/jpeg"}
+# Catalog images favour encode speed over size; level 1 is ~2-3x faster than the default 6.
+PNG_COMPRESS_LEVEL = 1
+# zlib and Pillow release the GIL while decoding/encoding, so image extraction
+# scales across threads.
+IMAGE_EXTRACTION_EXECUTOR = ThreadPoolExecutor(
+    max_workers=min(8, os.cpu_count() or 4),
+    thread_name_prefix="catalog-image",
+)
 
 NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
 NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
@@ -42,6 +61,55 @@ NS = {
     "a": NS_A,
 }
 
+TAG_PKG_RELATIONSHIP = f"{{{NS_PKG_REL}}}Relationship"
+TAG_CELL = f"{{{NS_MAIN}}}c"
+TAG_CELL_VALUE = f"{{{NS_MAIN}}}v"
+TAG_SHARED_STRING_ITEM = f"{{{NS_MAIN}}}si"
+TAG_PIC = f"{{{NS_XDR}}}pic"
+TAG_SP = f"{{{NS_XDR}}}sp"
+TAG_GRAPHIC_FRAME = f"{{{NS_XDR}}}graphicFrame"
+TAG_GRP_SP = f"{{{NS_XDR}}}grpSp"
+TAG_CXN_SP = f"{{{NS_XDR}}}cxnSp"
+TAG_BLIP = f"{{{NS_A}}}blip"
+TAG_ABSOLUTE_ANCHOR = f"{{{NS_XDR}}}absoluteAnchor"
+TAG_ONE_CELL_ANCHOR = f"{{{NS_XDR}}}oneCellAnchor"
+TAG_TWO_CELL_ANCHOR = f"{{{NS_XDR}}}twoCellAnchor"
+ATTR_REL_ID = f"{{{NS_REL}}}id"
+UNKNOWN_ERROR_TEXT = "#UNKNOWN!"
+# Byte-level prefilter: a part without this text holds no literal #UNKNOWN! value.
+UNKNOWN_ERROR_BYTES = re.compile(rb"#unknown!", re.IGNORECASE)
+# Cell types whose value is literal text in the sheet XML ("s" points into sharedStrings).
+TEXT_CELL_TYPES = frozenset({"e", "str", "inlineStr"})
+# Drawing elements counted for diagnostics, keyed by Clark-notation tag.
+DRAWING_TAG_COUNTERS = {
+    TAG_PIC: "pic",
+    TAG_SP: "sp",
+    TAG_GRAPHIC_FRAME: "graphicFrame",
+    TAG_GRP_SP: "grpSp",
+    TAG_CXN_SP: "cxnSp",
+    TAG_BLIP: "blip",
+    TAG_ONE_CELL_ANCHOR: "anchor",
+    TAG_TWO_CELL_ANCHOR: "anchor",
+    TAG_ABSOLUTE_ANCHOR: "anchor",
+}
+DRAWING_TAG_NAMES = tuple(DRAWING_TAG_COUNTERS)
+# openpyxl lists a sheet's images by anchor type in this order; following it
+# keeps img_N numbering identical to the earlier openpyxl-based extraction.
+ANCHOR_TAGS_IN_IMAGE_ORDER = (TAG_ABSOLUTE_ANCHOR, TAG_ONE_CELL_ANCHOR, TAG_TWO_CELL_ANCHOR)
+# Precompiled XPath runs in libxml2 instead of lxml's Python-level ElementPath.
+# An anchor holds a single picture, either directly or as the first one in a group.
+ANCHOR_EMBED_XPATH = ET.XPath(
+    "xdr:pic/xdr:blipFill/a:blip/@rel:embed | xdr:grpSp/xdr:pic[1]/xdr:blipFill/a:blip/@rel:embed",
+    namespaces=NS,
+)
+WORKBOOK_SHEETS_XPATH = ET.XPath("main:sheets/main:sheet", namespaces=NS)
+# Rich text runs included, phonetic (rPh) text excluded, as openpyxl reads it.
+CELL_TEXT_XPATH = ET.XPath("main:v/text() | main:is/main:t/text() | main:is/main:r/main:t/text()", namespaces=NS)
+SHARED_STRING_TEXT_XPATH = ET.XPath("main:t/text() | main:r/main:t/text()", namespaces=NS)
+
+# Shared parser for package XML; workbook parts never need external entities.
+XML_PARSER = ET.XMLParser(resolve_entities=False, remove_blank_text=True)
+
 logger = logging.getLogger(__name__)
 
 
@@ -55,9 +123,17 @@ class SheetDiagnostics:
     extraction_failures: int = 0
 
 
+@dataclass
+class WorkbookPackage:
+    diagnostics_by_sheet: dict[str, SheetDiagnostics]
+    media_parts_by_sheet: dict[str, list[str]]
+    worksheet_titles: list[str]
+    unmapped_media_count: int
+
+
 @dataclass
 class CatalogBuildResult:
-    categories: list[dict[str, object]]
+    categories: list[Category]
     workbook_source: str
     workbook_identity: str
     extraction_ms: int
@@ -69,6 +145,7 @@ class CatalogBuildResult:
 @dataclass
 class MediaImageResult:
     content: bytes
+    media_type: str
     etag: str
     cache_hit: bool
     workbook_source: str
@@ -76,41 +153,67 @@ class MediaImageResult:
 
 
 class CatalogService:
-    def __init__(self, settings: Settings, graph_client: GraphClient | None) -> None:
+    def __init__(
+        self,
+        settings: Settings,
+        graph_client_factory: Callable[[], GraphClient | None],
+    ) -> None:
         self.settings = settings
-        self.graph_client = graph_client
+        self._graph_client_factory = graph_client_factory
         self.cache_root = Path(tempfile.gettempdir()) / "artwork_cache"
         self.cache_root.mkdir(parents=True, exist_ok=True)
         self._identity_marker_path = self.cache_root / ".workbook_identity"
         self._last_built_workbook_identity: str | None = None
+        # (stat-based identity, full identity) of the last Graph workbook signed.
+        self._identity_memo: tuple[str, str] | None = None
+        # Last build, reused while the workbook identity is unchanged.
+        self._last_build_result: CatalogBuildResult | None = None
+        # (workbook identity, {category: [xl/media part, ...]}) for media lookups.
+        self._media_parts_cache: tuple[str, dict[str, list[str]]] | None = None
+
+    @property
+    def graph_client(self) -> GraphClient | None:
+        return self._graph_client_factory()
 
     @staticmethod
-    def _workbook_identity_from_path(path: Path) -> str:
-        if not path.exists() or not path.is_file():
+    def _stat_workbook(path: Path) -> os.stat_result | None:
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        return stat if S_ISREG(stat.st_mode) else None
+
+    @staticmethod
+    def _workbook_identity_from_stat(path: Path, stat: os.stat_result | None) -> str:
+        if stat is None:
             return f"{path}|missing"
-        stat = path.stat()
         return f"{path}|{stat.st_mtime_ns}|{stat.st_size}"
 
     @staticmethod
     def _graph_content_signature(path: Path) -> str | None:
-        if not path.exists() or not path.is_file():
-            return None
         try:
             with path.open("rb") as workbook_file:
                 chunk = workbook_file.read(GRAPH_SIGNATURE_BYTES)
-            return hashlib.sha1(chunk).hexdigest()[:16]
+            return hashlib.blake2b(chunk, digest_size=8).hexdigest()
         except OSError:
             return None
 
     def _compute_workbook_identity(self, path: Path) -> str:
-        base_identity = self._workbook_identity_from_path(path)
-        if self.settings.source_mode != "graph":
+        stat = self._stat_workbook(path)
+        base_identity = self._workbook_identity_from_stat(path, stat)
+        if self.settings.source_mode != "graph" or stat is None:
             return base_identity
 
+        # The content signature only changes when the file does, so hash it
+        # once per (path, mtime, size) instead of on every media request.
+        memo = self._identity_memo
+        if memo is not None and memo[0] == base_identity:
+            return memo[1]
+
         signature = self._graph_content_signature(path)
-        if not signature:
-            return base_identity
-        return f"{base_identity}|sig:{signature}"
+        identity = f"{base_identity}|sig:{signature}" if signature else base_identity
+        self._identity_memo = (base_identity, identity)
+        return identity
 
     def peek_workbook_identity(self) -> str:
         if self.settings.source_mode == "graph":
@@ -124,7 +227,11 @@ class CatalogService:
 
     @staticmethod
     def _safe_sheet_dir_name(sheet_name: str) -> str:
-        normalized = INVALID_DIR_CHARS.sub("_", sheet_name.strip())
+        stripped = sheet_name.strip()
+        # Already-safe names skip the regex; it only has to collapse invalid runs.
+        if stripped and SAFE_CATEGORY_CHARS.issuperset(stripped):
+            return stripped
+        normalized = INVALID_DIR_CHARS.sub("_", stripped)
         return normalized or "UNTITLED"
 
     @staticmethod
@@ -142,51 +249,175 @@ class CatalogService:
             suffix += 1
 
     @staticmethod
-    def _save_as_png(image_bytes: bytes, output_path: Path) -> None:
-        with Image.open(BytesIO(image_bytes)) as img:
-            img.save(output_path, format="PNG")
-
-    @staticmethod
-    def _to_png_bytes(image_bytes: bytes) -> bytes:
+    def _encode_png(image_bytes: bytes) -> bytes:
+        if image_bytes.startswith(PNG_SIGNATURE):
+            # verify() walks the chunk headers and CRCs without decoding pixels.
+            with Image.open(BytesIO(image_bytes)) as img:
+                img.verify()
+            return image_bytes
         with Image.open(BytesIO(image_bytes)) as img:
             output = BytesIO()
-            img.save(output, format="PNG")
+            img.save(output, format="PNG", compress_level=PNG_COMPRESS_LEVEL, optimize=False)
         return output.getvalue()
 
+    @staticmethod
+    def _write_atomic(path: Path, data: bytes) -> None:
+        # Readers never see a partially written cache file: write aside, then rename.
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+    @classmethod
+    def _write_image(cls, image_bytes: bytes, sheet_dir: Path, idx: int) -> Path:
+        # JPEGs keep their original bytes; PNGs pass through _encode_png untouched.
+        if image_bytes.startswith(JPEG_SIGNATURE):
+            output_path = sheet_dir / f"img_{idx}.jpg"
+            cls._write_atomic(output_path, image_bytes)
+        else:
+            output_path = sheet_dir / f"img_{idx}.png"
+            cls._write_atomic(output_path, cls._encode_png(image_bytes))
+        return output_path
+
+    @staticmethod
+    def _is_oversized_media(archive: ZipFile, media_part: str, max_image_bytes: int) -> bool:
+        # ZipInfo.file_size is the uncompressed size, known before anything is inflated.
+        return max_image_bytes > 0 and archive.getinfo(media_part).file_size > max_image_bytes
+
+    @classmethod
+    def _extract_one(
+        cls,
+        idx: int,
+        archive: ZipFile,
+        media_part: str,
+        sheet_dir: Path,
+        workbook_identity: str,
+        max_image_bytes: int,
+    ) -> tuple[int, str | None, Exception | None]:
+        try:
+            if cls._is_oversized_media(archive, media_part, max_image_bytes):
+                raise ValueError(f"image exceeds MAX_IMAGE_BYTES ({max_image_bytes} bytes)")
+            output_path = cls._write_image(archive.read(media_part), sheet_dir, idx)
+            # Stamp the file so media requests serve it from disk without re-encoding.
+            cls._write_cached_identity(cls._cache_meta_path(output_path), workbook_identity)
+        except Exception as exc:
+            return idx, None, exc
+        return idx, output_path.name, None
+
+    @staticmethod
+    def _is_safe_category(name: str) -> bool:
+        return bool(name) and SAFE_CATEGORY_CHARS.issuperset(name)
+
+    @staticmethod
+    def _is_media_cache_file(name: str) -> bool:
+        # Matches img_<digits>.png / img_<digits>.jpg / img_<digits>.meta.
+        if not name.startswith("img_") or not name.endswith(MEDIA_CACHE_FILE_SUFFIXES):
+            return False
+        index = name[4 : name.rindex(".")]
+        return index.isascii() and index.isdigit()
+
     @staticmethod
     def _should_ignore_sheet(sheet_name: str) -> bool:
         return bool(DEFAULT_SHEET_PATTERN.match(sheet_name.strip()))
 
     @staticmethod
+    @lru_cache(maxsize=1024)
     def _resolve_zip_target(base_part: str, target: str) -> str:
-        if target.startswith("/"):
+        # Relationship targets are short relative paths; resolve "." / ".." with a
+        # segment stack instead of posixpath.normpath. Pairs repeat across sheets.
+        if target[:1] == "/":
             return target.lstrip("/")
-        base_dir = posixpath.dirname(base_part)
-        return posixpath.normpath(posixpath.join(base_dir, target))
+        segments = base_part.rpartition("/")[0].split("/")
+        for segment in target.split("/"):
+            if segment == "..":
+                if segments:
+                    segments.pop()
+            elif segment and segment != ".":
+                segments.append(segment)
+        return "/".join(segment for segment in segments if segment)
 
     @staticmethod
-    def _rels_part_for(part: str) -> str:
-        return posixpath.join(posixpath.dirname(part), "_rels", f"{posixpath.basename(part)}.rels")
+    def _part_for_rels(rels_part: str) -> str:
+        # "xl/worksheets/_rels/sheet1.xml.rels" -> "xl/worksheets/sheet1.xml"
+        rels_dir, rels_name = posixpath.split(rels_part)
+        return posixpath.join(posixpath.dirname(rels_dir), rels_name.removesuffix(".rels"))
 
     @staticmethod
-    def _count_unknown_error_cells(worksheet) -> int:
+    def _is_unknown_error(value: str) -> bool:
+        return "#" in value and value.strip().upper() == UNKNOWN_ERROR_TEXT
+
+    def _unknown_shared_string_indices(
+        self,
+        archive: ZipFile,
+        names: frozenset[str],
+        workbook_part: str,
+        workbook_relationships: dict[str, tuple[str, str]],
+    ) -> frozenset[int]:
+        shared_strings_part = next(
+            (
+                self._resolve_zip_target(workbook_part, rel_target)
+                for rel_type, rel_target in workbook_relationships.values()
+                if rel_type.endswith("/sharedStrings")
+            ),
+            None,
+        )
+        if shared_strings_part is None or shared_strings_part not in names:
+            return frozenset()
+
+        xml_bytes = archive.read(shared_strings_part)
+        if not UNKNOWN_ERROR_BYTES.search(xml_bytes):
+            return frozenset()
+
+        indices: set[int] = set()
+        for index, (_, item) in enumerate(
+            ET.iterparse(BytesIO(xml_bytes), events=("end",), tag=TAG_SHARED_STRING_ITEM, resolve_entities=False)
+        ):
+            if self._is_unknown_error("".join(SHARED_STRING_TEXT_XPATH(item))):
+                indices.add(index)
+            item.clear()
+        return frozenset(indices)
+
+    def _count_unknown_error_cells(
+        self,
+        archive: ZipFile,
+        sheet_part: str,
+        unknown_shared_indices: frozenset[int],
+    ) -> int:
+        # Reads cached values the way data_only=True does: error, formula-string,
+        # inline and shared string cells whose text is #UNKNOWN!.
+        # The byte prefilter needs the whole part in memory; when shared strings can
+        # match it cannot skip the sheet anyway, so stream straight from the ZIP.
+        if unknown_shared_indices:
+            sheet_stream = archive.open(sheet_part)
+        else:
+            xml_bytes = archive.read(sheet_part)
+            if not UNKNOWN_ERROR_BYTES.search(xml_bytes):
+                return 0
+            sheet_stream = BytesIO(xml_bytes)
+
         count = 0
-        for row in worksheet.iter_rows():
-            for cell in row:
-                value = cell.value
-                if value is None:
-                    continue
-                if cell.data_type == "e" and str(value).strip().upper() == "#UNKNOWN!":
-                    count += 1
-                elif isinstance(value, str) and value.strip().upper() == "#UNKNOWN!":
+        with sheet_stream:
+            for _, cell in ET.iterparse(sheet_stream, events=("end",), tag=TAG_CELL, resolve_entities=False):
+                cell_type = cell.get("t", "n")
+                if cell_type == "s":
+                    shared_index = cell.findtext(TAG_CELL_VALUE) or ""
+                    if shared_index.isdigit() and int(shared_index) in unknown_shared_indices:
+                        count += 1
+                elif cell_type in TEXT_CELL_TYPES and self._is_unknown_error("".join(CELL_TEXT_XPATH(cell))):
                     count += 1
+                cell.clear()
+                while cell.getprevious() is not None:
+                    del cell.getparent()[0]
         return count
 
     @staticmethod
-    def _parse_relationships(xml_bytes: bytes) -> dict[str, tuple[str, str]]:
-        root = ET.fromstring(xml_bytes)
+    def _parse_relationships(rels_stream: IO[bytes]) -> dict[str, tuple[str, str]]:
+        root = ET.parse(rels_stream, XML_PARSER).getroot()
         relationships: dict[str, tuple[str, str]] = {}
-        for rel in root.findall("pkgrel:Relationship", NS):
+        for rel in root.iterchildren(TAG_PKG_RELATIONSHIP):
             rel_id = rel.attrib.get("Id")
             rel_type = rel.attrib.get("Type", "")
             rel_target = rel.attrib.get("Target", "")
@@ -194,14 +425,37 @@ class CatalogService:
                 relationships[rel_id] = (rel_type, rel_target)
         return relationships
 
+    def _collect_all_relationships(
+        self,
+        archive: ZipFile,
+        names: frozenset[str],
+    ) -> dict[str, dict[str, tuple[str, str]]]:
+        relationships_by_part: dict[str, dict[str, tuple[str, str]]] = {}
+        for name in names:
+            if name.endswith(".rels"):
+                with archive.open(name) as rels_stream:
+                    relationships_by_part[self._part_for_rels(name)] = self._parse_relationships(rels_stream)
+        return relationships_by_part
+
+    @staticmethod
+    def _anchor_picture_embed(anchor) -> str | None:
+        embed_ids = ANCHOR_EMBED_XPATH(anchor)
+        return str(embed_ids[0]) if embed_ids else None
+
     def _analyze_sheet_drawings(
         self,
         archive: ZipFile,
+        names: frozenset[str],
         sheet_part: str,
-        sheet_relationships: dict[str, tuple[str, str]],
+        relationships_by_part: dict[str, dict[str, tuple[str, str]]],
         diagnostics: SheetDiagnostics,
         mapped_media_targets: set[str],
-    ) -> None:
+    ) -> list[str]:
+        sheet_media_parts: list[str] = []
+        sheet_relationships = relationships_by_part.get(sheet_part)
+        if not sheet_relationships:
+            return sheet_media_parts
+
         drawing_targets = [
             target
             for rel_type, target in sheet_relationships.values()
@@ -211,21 +465,38 @@ class CatalogService:
 
         for drawing_target in drawing_targets:
             drawing_part = self._resolve_zip_target(sheet_part, drawing_target)
-            if drawing_part not in archive.namelist():
+            if drawing_part not in names:
                 continue
 
-            drawing_root = ET.fromstring(archive.read(drawing_part))
-            pic_count = len(drawing_root.findall(".//xdr:pic", NS))
-            sp_count = len(drawing_root.findall(".//xdr:sp", NS))
-            gf_count = len(drawing_root.findall(".//xdr:graphicFrame", NS))
-            grp_count = len(drawing_root.findall(".//xdr:grpSp", NS))
-            cxn_count = len(drawing_root.findall(".//xdr:cxnSp", NS))
-            blip_count = len(drawing_root.findall(".//a:blip", NS))
-            anchor_count = (
-                len(drawing_root.findall(".//xdr:oneCellAnchor", NS))
-                + len(drawing_root.findall(".//xdr:twoCellAnchor", NS))
-                + len(drawing_root.findall(".//xdr:absoluteAnchor", NS))
-            )
+            counts = dict.fromkeys(DRAWING_TAG_COUNTERS.values(), 0)
+            embeds_by_anchor: dict[str, list[str]] = {tag: [] for tag in ANCHOR_TAGS_IN_IMAGE_ORDER}
+            # Single streaming pass fed straight from the ZIP member, so the
+            # drawing is never fully decompressed in memory; anchors are
+            # cleared and detached once closed so the tree stays flat as well.
+            with archive.open(drawing_part) as drawing_stream:
+                for _, element in ET.iterparse(
+                    drawing_stream,
+                    events=("end",),
+                    tag=DRAWING_TAG_NAMES,
+                    resolve_entities=False,
+                ):
+                    counter = DRAWING_TAG_COUNTERS[element.tag]
+                    counts[counter] += 1
+                    if counter == "anchor":
+                        embed_id = self._anchor_picture_embed(element)
+                        if embed_id:
+                            embeds_by_anchor[element.tag].append(embed_id)
+                        element.clear()
+                        # Drop the emptied anchors already processed before this one.
+                        while element.getprevious() is not None:
+                            del element.getparent()[0]
+            pic_count = counts["pic"]
+            sp_count = counts["sp"]
+            gf_count = counts["graphicFrame"]
+            grp_count = counts["grpSp"]
+            cxn_count = counts["cxnSp"]
+            blip_count = counts["blip"]
+            anchor_count = counts["anchor"]
 
             object_count = pic_count + sp_count + gf_count + grp_count + cxn_count
             if object_count == 0 and anchor_count > 0:
@@ -235,67 +506,114 @@ class CatalogService:
             diagnostics.drawing_pictures += pic_count
             diagnostics.embedded_image_refs += blip_count
 
-            drawing_rels_part = self._rels_part_for(drawing_part)
-            if drawing_rels_part not in archive.namelist():
-                continue
-
-            drawing_relationships = self._parse_relationships(archive.read(drawing_rels_part))
+            drawing_relationships = relationships_by_part.get(drawing_part, {})
             for rel_type, rel_target in drawing_relationships.values():
                 if "/image" not in rel_type:
                     continue
                 media_part = self._resolve_zip_target(drawing_part, rel_target)
                 mapped_media_targets.add(media_part)
 
-    def _analyze_xlsx_package(self, workbook_bytes: bytes) -> tuple[dict[str, SheetDiagnostics], int]:
-        diagnostics_by_sheet: dict[str, SheetDiagnostics] = {}
+            for anchor_tag in ANCHOR_TAGS_IN_IMAGE_ORDER:
+                for embed_id in embeds_by_anchor[anchor_tag]:
+                    rel_type, rel_target = drawing_relationships.get(embed_id, ("", ""))
+                    if not rel_type.endswith("/image"):
+                        continue
+                    media_part = self._resolve_zip_target(drawing_part, rel_target)
+                    if media_part in names:
+                        sheet_media_parts.append(media_part)
+
+        return sheet_media_parts
+
+    def _analyze_xlsx_package(self, archive: ZipFile, count_unknown_cells: bool = True) -> WorkbookPackage:
+        package = WorkbookPackage(
+            diagnostics_by_sheet={},
+            media_parts_by_sheet={},
+            worksheet_titles=[],
+            unmapped_media_count=0,
+        )
         mapped_media_targets: set[str] = set()
 
-        with ZipFile(BytesIO(workbook_bytes)) as archive:
-            workbook_part = "xl/workbook.xml"
-            workbook_rels_part = "xl/_rels/workbook.xml.rels"
-
-            if workbook_part not in archive.namelist() or workbook_rels_part not in archive.namelist():
-                return diagnostics_by_sheet, 0
+        workbook_part = "xl/workbook.xml"
+        # One membership set and one parse per .rels part for the whole package.
+        names = frozenset(archive.namelist())
+        relationships_by_part = self._collect_all_relationships(archive, names)
+
+        if workbook_part not in names or workbook_part not in relationships_by_part:
+            return package
+
+        with archive.open(workbook_part) as workbook_stream:
+            workbook_root = ET.parse(workbook_stream, XML_PARSER).getroot()
+        workbook_relationships = relationships_by_part[workbook_part]
+        # Media lookups only need the drawing walk, not the sheet/sharedStrings scan.
+        unknown_shared_indices = (
+            self._unknown_shared_string_indices(archive, names, workbook_part, workbook_relationships)
+            if count_unknown_cells
+            else frozenset()
+        )
+        for sheet in WORKBOOK_SHEETS_XPATH(workbook_root):
+            sheet_name = sheet.attrib.get("name", "")
+            rel_id = sheet.attrib.get(ATTR_REL_ID)
+            if not sheet_name or not rel_id or rel_id not in workbook_relationships:
+                continue
 
-            workbook_root = ET.fromstring(archive.read(workbook_part))
-            workbook_relationships = self._parse_relationships(archive.read(workbook_rels_part))
-            sheets_node = workbook_root.find("main:sheets", NS)
-            if sheets_node is None:
-                return diagnostics_by_sheet, 0
+            sheet_type, sheet_target = workbook_relationships[rel_id]
+            sheet_part = self._resolve_zip_target(workbook_part, sheet_target)
+            diagnostics = SheetDiagnostics()
+            package.diagnostics_by_sheet[sheet_name] = diagnostics
+            if sheet_type.endswith("/worksheet"):
+                package.worksheet_titles.append(sheet_name)
+                if count_unknown_cells and sheet_part in names and not self._should_ignore_sheet(sheet_name):
+                    diagnostics.unknown_error_cells = self._count_unknown_error_cells(
+                        archive,
+                        sheet_part,
+                        unknown_shared_indices,
+                    )
+
+            package.media_parts_by_sheet[sheet_name] = self._analyze_sheet_drawings(
+                archive=archive,
+                names=names,
+                sheet_part=sheet_part,
+                relationships_by_part=relationships_by_part,
+                diagnostics=diagnostics,
+                mapped_media_targets=mapped_media_targets,
+            )
 
-            for sheet in sheets_node.findall("main:sheet", NS):
-                sheet_name = sheet.attrib.get("name", "")
-                rel_id = sheet.attrib.get(f"{{{NS_REL}}}id")
-                if not sheet_name or not rel_id or rel_id not in workbook_relationships:
-                    continue
+        media_parts = {path for path in names if path.startswith("xl/media/") and not path.endswith("/")}
+        package.unmapped_media_count = len(media_parts - mapped_media_targets)
 
-                _, sheet_target = workbook_relationships[rel_id]
-                sheet_part = self._resolve_zip_target(workbook_part, sheet_target)
-                diagnostics = SheetDiagnostics()
-                diagnostics_by_sheet[sheet_name] = diagnostics
+        return package
 
-                sheet_rels_part = self._rels_part_for(sheet_part)
-                if sheet_rels_part not in archive.namelist():
-                    continue
-
-                sheet_relationships = self._parse_relationships(archive.read(sheet_rels_part))
-                self._analyze_sheet_drawings(
-                    archive=archive,
-                    sheet_part=sheet_part,
-                    sheet_relationships=sheet_relationships,
-                    diagnostics=diagnostics,
-                    mapped_media_targets=mapped_media_targets,
-                )
+    def _media_parts_by_category(self, package: WorkbookPackage) -> dict[str, list[str]]:
+        media_parts_by_category: dict[str, list[str]] = {}
+        used_sheet_dirs: set[str] = set()
+        for sheet_title in package.worksheet_titles:
+            if self._should_ignore_sheet(sheet_title):
+                continue
+            safe_sheet_name = self._resolve_unique_dir_name(
+                self._safe_sheet_dir_name(sheet_title),
+                used_sheet_dirs,
+            )
+            media_parts_by_category[safe_sheet_name] = package.media_parts_by_sheet.get(sheet_title, [])
+        return media_parts_by_category
 
-            media_parts = {
-                path for path in archive.namelist() if path.startswith("xl/media/") and not path.endswith("/")
-            }
-            unmapped_media_count = len(media_parts - mapped_media_targets)
+    def _resolve_media_parts(self, archive: ZipFile, workbook_identity: str, category: str) -> list[str]:
+        cached = self._media_parts_cache
+        if cached is None or cached[0] != workbook_identity:
+            package = self._analyze_xlsx_package(archive, count_unknown_cells=False)
+            cached = (workbook_identity, self._media_parts_by_category(package))
+            self._media_parts_cache = cached
 
-        return diagnostics_by_sheet, unmapped_media_count
+        media_parts = cached[1].get(category)
+        if media_parts is None:
+            raise FileNotFoundError("Unknown media category.")
+        return media_parts
 
     @staticmethod
-    def _build_notes(extracted_images_count: int, diagnostics: SheetDiagnostics) -> str | None:
+    def _build_notes(
+        extracted_images_count: int,
+        diagnostics: SheetDiagnostics,
+        unsupported_count: int,
+    ) -> str | None:
         if diagnostics.unknown_error_cells > 0:
             return "Worksheet contains #UNKNOWN! values; unsupported typed objects may not be extractable."
 
@@ -304,7 +622,6 @@ class CatalogService:
                 return "Worksheet has drawing content that is not available as standard embedded images."
             return "No standard embedded images were found in this worksheet."
 
-        unsupported_count = CatalogService._unsupported_objects_count(extracted_images_count, diagnostics)
         if unsupported_count > 0:
             return "Some worksheet objects are not standard embedded images."
 
@@ -338,12 +655,11 @@ class CatalogService:
 
     async def _resolve_workbook_path(self) -> Path:
         if self.settings.source_mode == "graph":
-            if self.graph_client is None:
+            graph_client = self.graph_client
+            if graph_client is None:
                 raise RuntimeError("Graph client is not configured.")
-            workbook_bytes = await self.graph_client.download_excel_file()
             graph_path = self._graph_tmp_workbook_path()
-            graph_path.parent.mkdir(parents=True, exist_ok=True)
-            graph_path.write_bytes(workbook_bytes)
+            await graph_client.download_excel_file(graph_path)
             return graph_path
 
         local_path = self._resolve_local_xlsx_path()
@@ -355,26 +671,13 @@ class CatalogService:
 
     @staticmethod
     def _parse_filename_index(filename: str) -> int | None:
-        match = re.fullmatch(r"img_(\d+)\.png", filename)
-        if match is None:
+        # Accept only img_<ASCII digits>.png/.jpg, the names the catalog build writes.
+        if not filename.startswith("img_") or filename[-4:] not in MEDIA_TYPES_BY_SUFFIX:
             return None
-        return int(match.group(1))
-
-    def _resolve_sheet_by_category(self, workbook, category: str):
-        used_sheet_dirs: set[str] = set()
-
-        for worksheet in workbook.worksheets:
-            if self._should_ignore_sheet(worksheet.title):
-                continue
-
-            safe_sheet_name = self._resolve_unique_dir_name(
-                self._safe_sheet_dir_name(worksheet.title),
-                used_sheet_dirs,
-            )
-            if safe_sheet_name == category:
-                return worksheet
-
-        return None
+        index = filename[4:-4]
+        if not index.isascii() or not index.isdigit():
+            return None
+        return int(index)
 
     def _cache_path(self, category: str, filename: str) -> Path:
         return self.cache_root / category / filename
@@ -399,33 +702,40 @@ class CatalogService:
             return []
 
         cleaned_dirs: list[str] = []
-        removed_png_count = 0
+        removed_image_count = 0
         removed_meta_count = 0
-        for child in self.cache_root.iterdir():
-            if not child.is_dir() or not SAFE_CATEGORY_PATTERN.fullmatch(child.name):
-                continue
-
-            removed_in_dir = False
-            for file_path in child.iterdir():
-                if not file_path.is_file():
+        with os.scandir(self.cache_root) as entries:
+            category_dirs = [
+                entry.path
+                for entry in entries
+                if entry.is_dir(follow_symlinks=False) and self._is_safe_category(entry.name)
+            ]
+
+        for category_dir in category_dirs:
+            with os.scandir(category_dir) as entries:
+                dir_entries = list(entries)
+
+            removed_in_dir = 0
+            for entry in dir_entries:
+                if not entry.is_file(follow_symlinks=False) or not self._is_media_cache_file(entry.name):
                     continue
-                if not MEDIA_CACHE_FILE_PATTERN.fullmatch(file_path.name):
-                    continue
-                file_path.unlink(missing_ok=True)
-                removed_in_dir = True
-                if file_path.suffix == ".png":
-                    removed_png_count += 1
-                else:
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+                removed_in_dir += 1
+                if entry.name.endswith(".meta"):
                     removed_meta_count += 1
+                else:
+                    removed_image_count += 1
 
             if removed_in_dir:
-                cleaned_dirs.append(child.name)
-                # Remove category dir only if no unrelated files remain.
-                try:
-                    next(child.iterdir())
-                except StopIteration:
+                cleaned_dirs.append(os.path.basename(category_dir))
+                # Remove category dir only if no unrelated files remain; the
+                # single listing above already tells us whether it is now empty.
+                if removed_in_dir == len(dir_entries):
                     try:
-                        child.rmdir()
+                        os.rmdir(category_dir)
                     except OSError:
                         pass
 
@@ -436,7 +746,7 @@ class CatalogService:
                     "old_identity": old_identity,
                     "new_identity": new_identity,
                     "cleaned_category_dirs": cleaned_dirs if cleaned_dirs else "none",
-                    "images_removed": removed_png_count,
+                    "images_removed": removed_image_count,
                     "meta_removed": removed_meta_count,
                 },
                 separators=(",", ":"),
@@ -450,129 +760,207 @@ class CatalogService:
 
     @staticmethod
     def _read_cached_identity(cache_meta_path: Path) -> str | None:
-        if not cache_meta_path.exists() or not cache_meta_path.is_file():
+        try:
+            return cache_meta_path.read_text(encoding="utf-8").strip() or None
+        except OSError:
             return None
-        return cache_meta_path.read_text(encoding="utf-8").strip() or None
 
-    @staticmethod
-    def _write_cached_identity(cache_meta_path: Path, workbook_identity: str) -> None:
-        cache_meta_path.write_text(workbook_identity, encoding="utf-8")
+    @classmethod
+    def _write_cached_identity(cls, cache_meta_path: Path, workbook_identity: str) -> None:
+        cls._write_atomic(cache_meta_path, workbook_identity.encode("utf-8"))
 
     @staticmethod
-    def _build_media_etag(cache_path: Path, workbook_identity: str, filename: str) -> str:
-        stat = cache_path.stat()
+    def _build_media_etag(content_size: int, workbook_identity: str, filename: str) -> str:
+        # Identity + filename pin the content; the size is known in memory, so no stat().
         etag_seed = f"{workbook_identity}|{filename}"
-        workbook_hash = hashlib.sha1(etag_seed.encode("utf-8")).hexdigest()[:16]
-        return f'W/"{stat.st_mtime_ns:x}-{stat.st_size:x}-{workbook_hash}"'
+        workbook_hash = hashlib.blake2b(etag_seed.encode("utf-8"), digest_size=8).hexdigest()
+        return f'W/"{content_size:x}-{workbook_hash}"'
 
-    async def get_media_image(self, category: str, filename: str) -> MediaImageResult:
-        if not SAFE_CATEGORY_PATTERN.fullmatch(category):
-            raise FileNotFoundError("Invalid media category.")
-
-        image_index = self._parse_filename_index(filename)
-        if image_index is None:
-            raise FileNotFoundError("Invalid media filename.")
-
-        cache_path = self._cache_path(category, filename)
-        cache_meta_path = self._cache_meta_path(cache_path)
+    def _read_cached_media(self, cache_path: Path, filename: str) -> MediaImageResult | None:
         current_identity = self.peek_workbook_identity()
-
-        if cache_path.exists() and cache_path.is_file():
-            cached_identity = self._read_cached_identity(cache_meta_path)
-            if cached_identity and cached_identity == current_identity:
-                return MediaImageResult(
-                    content=cache_path.read_bytes(),
-                    etag=self._build_media_etag(cache_path, cached_identity, filename),
-                    cache_hit=True,
-                    workbook_source=cached_identity.split("|", 1)[0],
-                    workbook_identity=cached_identity,
-                )
-
-        workbook_path = await self._resolve_workbook_path()
-        workbook_identity = self._compute_workbook_identity(workbook_path)
-        workbook = load_workbook(filename=workbook_path, data_only=True)
+        cached_identity = self._read_cached_identity(self._cache_meta_path(cache_path))
+        if not cached_identity or cached_identity != current_identity:
+            return None
 
         try:
-            worksheet = self._resolve_sheet_by_category(workbook, category)
-            if worksheet is None:
-                raise FileNotFoundError("Unknown media category.")
+            content = cache_path.read_bytes()
+        except OSError:
+            return None
+        return MediaImageResult(
+            content=content,
+            media_type=MEDIA_TYPES_BY_SUFFIX[cache_path.suffix],
+            etag=self._build_media_etag(len(content), cached_identity, filename),
+            cache_hit=True,
+            workbook_source=cached_identity.split("|", 1)[0],
+            workbook_identity=cached_identity,
+        )
 
-            images = getattr(worksheet, "_images", [])
-            if image_index < 1 or image_index > len(images):
+    def _extract_media_image(
+        self,
+        workbook_path: Path,
+        category: str,
+        filename: str,
+        image_index: int,
+        cache_path: Path,
+    ) -> MediaImageResult:
+        workbook_identity = self._compute_workbook_identity(workbook_path)
+        with ZipFile(workbook_path) as archive:
+            media_parts = self._resolve_media_parts(archive, workbook_identity, category)
+            if image_index < 1 or image_index > len(media_parts):
                 raise FileNotFoundError("Image index out of range.")
 
-            raw_bytes = images[image_index - 1]._data()
-            png_bytes = self._to_png_bytes(raw_bytes)
-        except FileNotFoundError:
-            raise
-        except Exception as exc:
-            raise RuntimeError(f"Image extraction failed for {category}/{filename}: {exc}") from exc
-        finally:
-            close = getattr(workbook, "close", None)
-            if callable(close):
-                close()
+            media_part = media_parts[image_index - 1]
+            # Oversized images are left out of the catalog; do not decode them here either.
+            if self._is_oversized_media(archive, media_part, self.settings.max_image_bytes):
+                raise FileNotFoundError("Image exceeds MAX_IMAGE_BYTES.")
+
+            # Read the single media part straight from the package; no workbook parse.
+            try:
+                raw_bytes = archive.read(media_part)
+            except Exception as exc:
+                raise RuntimeError(f"Image extraction failed for {category}/{filename}: {exc}") from exc
+
+        # .jpg names are only handed out for JPEG sources; .png always works,
+        # transcoding if needed, so URLs from older catalogs stay valid.
+        if cache_path.suffix == ".jpg":
+            if not raw_bytes.startswith(JPEG_SIGNATURE):
+                raise FileNotFoundError("Image is not available as JPEG.")
+            image_bytes = raw_bytes
+        else:
+            try:
+                image_bytes = self._encode_png(raw_bytes)
+            except Exception as exc:
+                raise RuntimeError(f"Image extraction failed for {category}/{filename}: {exc}") from exc
 
         cache_path.parent.mkdir(parents=True, exist_ok=True)
-        cache_path.write_bytes(png_bytes)
-        self._write_cached_identity(cache_meta_path, workbook_identity)
+        self._write_atomic(cache_path, image_bytes)
+        self._write_cached_identity(self._cache_meta_path(cache_path), workbook_identity)
         return MediaImageResult(
-            content=png_bytes,
-            etag=self._build_media_etag(cache_path, workbook_identity, filename),
+            content=image_bytes,
+            media_type=MEDIA_TYPES_BY_SUFFIX[cache_path.suffix],
+            etag=self._build_media_etag(len(image_bytes), workbook_identity, filename),
             cache_hit=False,
             workbook_source=str(workbook_path),
             workbook_identity=workbook_identity,
         )
 
-    async def build_catalog_result(self) -> CatalogBuildResult:
+    async def get_media_image(self, category: str, filename: str) -> MediaImageResult:
+        if not self._is_safe_category(category):
+            raise FileNotFoundError("Invalid media category.")
+
+        image_index = self._parse_filename_index(filename)
+        if image_index is None:
+            raise FileNotFoundError("Invalid media filename.")
+
+        # Disk, ZIP and Pillow work runs in worker threads to keep the event loop free.
+        cache_path = self._cache_path(category, filename)
+        cached_result = await asyncio.to_thread(self._read_cached_media, cache_path, filename)
+        if cached_result is not None:
+            return cached_result
+
+        workbook_path = await self._resolve_workbook_path()
+        return await asyncio.to_thread(
+            self._extract_media_image,
+            workbook_path,
+            category,
+            filename,
+            image_index,
+            cache_path,
+        )
+
+    async def build_catalog_result(self, force: bool = False) -> CatalogBuildResult:
         started_at = time.perf_counter()
         workbook_path = await self._resolve_workbook_path()
+        # The build is blocking ZIP/XML/Pillow/disk work; keep it off the event loop.
+        return await asyncio.to_thread(self._build_catalog_from_workbook, workbook_path, started_at, force)
+
+    def _build_catalog_from_workbook(
+        self,
+        workbook_path: Path,
+        started_at: float,
+        force: bool = False,
+    ) -> CatalogBuildResult:
         workbook_identity = self._compute_workbook_identity(workbook_path)
-        workbook_bytes = workbook_path.read_bytes()
+        # An unchanged workbook (including a Graph 304) yields the same catalog,
+        # unless the caller explicitly asked for a rebuild.
+        previous_result = self._last_build_result
+        if not force and previous_result is not None and previous_result.workbook_identity == workbook_identity:
+            logger.info("Workbook unchanged since last build; reusing catalog for %s", workbook_identity)
+            return replace(
+                previous_result,
+                extraction_ms=0,
+                total_ms=int((time.perf_counter() - started_at) * 1000),
+            )
 
         extraction_started_at = time.perf_counter()
-        package_diagnostics_by_sheet, unmapped_media_count = self._analyze_xlsx_package(workbook_bytes)
-
-        self.cache_root.mkdir(parents=True, exist_ok=True)
-        previous_identity = self._read_last_built_workbook_identity()
-        self._invalidate_stale_media_cache(previous_identity, workbook_identity)
-        self._store_last_built_workbook_identity(workbook_identity)
-
-        workbook = load_workbook(filename=workbook_path, data_only=True)
-        categories: list[dict[str, object]] = []
-        category_stats: list[dict[str, object]] = []
-        total_images = 0
-        used_sheet_dirs: set[str] = set()
-
-        try:
-            for worksheet in workbook.worksheets:
-                if self._should_ignore_sheet(worksheet.title):
-                    logger.debug("Skipping default worksheet '%s' from catalog", worksheet.title)
+        # One archive handle serves both the package analysis and image extraction.
+        with ZipFile(workbook_path) as archive:
+            package = self._analyze_xlsx_package(archive)
+            self._media_parts_cache = (workbook_identity, self._media_parts_by_category(package))
+
+            self.cache_root.mkdir(parents=True, exist_ok=True)
+            previous_identity = self._read_last_built_workbook_identity()
+            self._invalidate_stale_media_cache(previous_identity, workbook_identity)
+            self._store_last_built_workbook_identity(workbook_identity)
+
+            # Everything the catalog needs comes from the package analysis; the
+            # workbook is never loaded through openpyxl.
+            categories: list[Category] = []
+            category_stats: list[dict[str, object]] = []
+            total_images = 0
+            used_sheet_dirs: set[str] = set()
+
+            # Queue every sheet's images before collecting any results, so the
+            # pool stays busy across sheets instead of draining sheet by sheet.
+            sheet_jobs: list[tuple[str, str, list[Future[tuple[int, str | None, Exception | None]]]]] = []
+            for sheet_title in package.worksheet_titles:
+                if self._should_ignore_sheet(sheet_title):
+                    logger.debug("Skipping default worksheet '%s' from catalog", sheet_title)
                     continue
 
                 safe_sheet_name = self._resolve_unique_dir_name(
-                    self._safe_sheet_dir_name(worksheet.title),
+                    self._safe_sheet_dir_name(sheet_title),
                     used_sheet_dirs,
                 )
                 sheet_dir = self.cache_root / safe_sheet_name
-                sheet_dir.mkdir(parents=True, exist_ok=True)
-
-                diagnostics = package_diagnostics_by_sheet.get(worksheet.title, SheetDiagnostics())
-                diagnostics.unknown_error_cells = self._count_unknown_error_cells(worksheet)
+                sheet_media_parts = package.media_parts_by_sheet.get(sheet_title, [])
+                if sheet_media_parts:
+                    # cache_root exists by now: one mkdir, no parent walk or follow-up stat.
+                    try:
+                        os.mkdir(sheet_dir)
+                    except FileExistsError:
+                        pass
 
-                images = getattr(worksheet, "_images", [])
+                extraction_futures = [
+                    IMAGE_EXTRACTION_EXECUTOR.submit(
+                        self._extract_one,
+                        idx,
+                        archive,
+                        media_part,
+                        sheet_dir,
+                        workbook_identity,
+                        self.settings.max_image_bytes,
+                    )
+                    for idx, media_part in enumerate(sheet_media_parts, start=1)
+                ]
+                sheet_jobs.append((sheet_title, safe_sheet_name, extraction_futures))
+
+            for sheet_title, safe_sheet_name, extraction_futures in sheet_jobs:
+                diagnostics = package.diagnostics_by_sheet.get(sheet_title, SheetDiagnostics())
                 image_urls: list[str] = []
-
-                for idx, image in enumerate(images, start=1):
-                    try:
-                        output_path = sheet_dir / f"img_{idx}.png"
-                        raw_bytes = image._data()
-                        self._save_as_png(raw_bytes, output_path)
-                        image_urls.append(f"/api/media/{quote(safe_sheet_name)}/img_{idx}.png")
-                    except Exception as exc:
+                # Safe dir names are [A-Za-z0-9._-] only, so they need no percent-encoding.
+                url_prefix = f"/api/media/{safe_sheet_name}/"
+
+                # Futures are collected in submission order, so URLs stay sorted by index.
+                for extraction_future in extraction_futures:
+                    idx, image_filename, exc = extraction_future.result()
+                    if exc is None:
+                        image_urls.append(url_prefix + image_filename)
+                    else:
                         diagnostics.extraction_failures += 1
                         logger.warning(
                             "Image extraction failed for sheet '%s' image #%s: %s",
-                            worksheet.title,
+                            sheet_title,
                             idx,
                             exc,
                         )
@@ -580,12 +968,12 @@ class CatalogService:
                 images_count = len(image_urls)
                 total_images += images_count
                 unsupported_count = self._unsupported_objects_count(images_count, diagnostics)
-                notes = self._build_notes(images_count, diagnostics)
+                notes = self._build_notes(images_count, diagnostics, unsupported_count)
 
                 logger.info(
                     "Catalog sheet '%s': extracted_images=%s drawing_objects=%s drawing_pictures=%s "
                     "unknown_error_cells=%s extraction_failures=%s unsupported_detected=%s note=%s",
-                    worksheet.title,
+                    sheet_title,
                     images_count,
                     diagnostics.drawing_objects,
                     diagnostics.drawing_pictures,
@@ -597,7 +985,7 @@ class CatalogService:
 
                 category_stats.append(
                     {
-                        "name": worksheet.title,
+                        "name": sheet_title,
                         "images_count": images_count,
                         "unsupported_objects_detected": unsupported_count > 0,
                     }
@@ -605,28 +993,24 @@ class CatalogService:
 
                 categories.append(
                     {
-                        "name": worksheet.title,
+                        "name": sheet_title,
                         "images": image_urls,
                         "images_count": images_count,
                         "unsupported_objects_detected": unsupported_count > 0,
                         "notes": notes,
                     }
                 )
-        finally:
-            close = getattr(workbook, "close", None)
-            if callable(close):
-                close()
 
-        if unmapped_media_count > 0:
+        if package.unmapped_media_count > 0:
             # ZIP fallback signal: media files exist in package without clear sheet mapping.
             logger.info(
                 "Workbook contains %s media file(s) in xl/media not mapped to extracted sheet images",
-                unmapped_media_count,
+                package.unmapped_media_count,
             )
 
         extraction_ms = int((time.perf_counter() - extraction_started_at) * 1000)
         total_ms = int((time.perf_counter() - started_at) * 1000)
-        return CatalogBuildResult(
+        build_result = CatalogBuildResult(
             categories=categories,
             workbook_source=str(workbook_path),
             workbook_identity=workbook_identity,
@@ -635,6 +1019,8 @@ class CatalogService:
             total_images=total_images,
             category_stats=category_stats,
         )
+        self._last_build_result = build_result
+        return build_result
 
-    async def build_catalog(self) -> list[dict[str, object]]:
+    async def build_catalog(self) -> list[Category]:
         return (await self.build_catalog_result()).categories
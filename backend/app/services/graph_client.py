@@ -1,8 +1,13 @@
 from __future__ import annotations
 
+import asyncio
 import base64
+import os
 import re
+import tempfile
 import time
+from pathlib import Path
+from typing import IO
 from urllib.parse import quote, unquote, urlparse
 
 import httpx
@@ -11,6 +16,7 @@ from app.config import Settings
 
 
 DRIVE_ITEM_PATTERN = re.compile(r"/drives/([^/]+)/items/([^/]+)")
+DOWNLOAD_CHUNK_BYTES = 1 << 20
 
 
 class GraphClient:
@@ -19,6 +25,25 @@ class GraphClient:
         self._token: str | None = None
         self._token_expires_at: float = 0
         self._timeout = httpx.Timeout(connect=10.0, read=10.0, write=10.0, pool=10.0)
+        self._client: httpx.AsyncClient | None = None
+        # ETag of the content last written to each destination, for conditional GETs.
+        self._download_etags: dict[Path, str] = {}
+
+    @property
+    def _http_client(self) -> httpx.AsyncClient:
+        # One pooled client so token, drive-item and download calls reuse
+        # keep-alive connections instead of a fresh TLS handshake each.
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self._timeout,
+                limits=httpx.Limits(max_keepalive_connections=10),
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
     @staticmethod
     def _encode_share_url(share_url: str) -> str:
@@ -42,8 +67,7 @@ class GraphClient:
             "grant_type": "client_credentials",
         }
 
-        async with httpx.AsyncClient(timeout=self._timeout) as client:
-            response = await client.post(token_url, data=payload)
+        response = await self._http_client.post(token_url, data=payload)
 
         if response.status_code != 200:
             raise RuntimeError(f"Graph token request failed ({response.status_code}).")
@@ -59,29 +83,82 @@ class GraphClient:
 
     async def _get_json(self, url: str, token: str) -> dict:
         headers = {"Authorization": f"Bearer {token}"}
-        async with httpx.AsyncClient(timeout=self._timeout) as client:
-            response = await client.get(url, headers=headers)
+        response = await self._http_client.get(url, headers=headers)
 
         if response.status_code >= 400:
             raise RuntimeError(f"Graph request failed ({response.status_code}).")
         return response.json()
 
-    async def _download_from_url(self, url: str, token: str) -> bytes:
-        headers = {"Authorization": f"Bearer {token}"}
-        async with httpx.AsyncClient(timeout=self._timeout, follow_redirects=True) as client:
-            response = await client.get(url, headers=headers)
+    @staticmethod
+    def _open_part_file(destination: Path) -> IO[bytes]:
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=destination.parent, suffix=".part", delete=False)
 
-        if response.status_code >= 400:
-            raise RuntimeError(f"Graph file download failed ({response.status_code}).")
-        return response.content
+    @staticmethod
+    def _finish_part_file(part_file: IO[bytes], destination: Path, not_modified: bool) -> int:
+        part_file.close()
+        part_path = Path(part_file.name)
+        if not_modified:
+            # Leave the existing file (and its mtime-based identity) untouched.
+            part_path.unlink(missing_ok=True)
+            return destination.stat().st_size
+        os.replace(part_path, destination)
+        return destination.stat().st_size
 
-    async def _download_from_drive_item(self, drive_id: str, item_id: str, token: str) -> bytes:
+    @staticmethod
+    def _discard_part_file(part_file: IO[bytes]) -> None:
+        part_file.close()
+        Path(part_file.name).unlink(missing_ok=True)
+
+    async def _download_from_url(self, url: str, token: str, destination: Path, conditional: bool) -> int:
+        headers = {"Authorization": f"Bearer {token}"}
+        known_etag = self._download_etags.get(destination) if conditional else None
+        # Stream to a sibling temp file and rename, so the workbook is never
+        # buffered whole in memory and readers never see a partial file. All
+        # file I/O runs in worker threads to keep the event loop free.
+        part_file = await asyncio.to_thread(self._open_part_file, destination)
+        try:
+            if known_etag and await asyncio.to_thread(destination.is_file):
+                headers["If-None-Match"] = known_etag
+            async with self._http_client.stream(
+                "GET", url, headers=headers, follow_redirects=True
+            ) as response:
+                if response.status_code >= 400:
+                    raise RuntimeError(f"Graph file download failed ({response.status_code}).")
+                not_modified = response.status_code == 304
+                etag = response.headers.get("ETag")
+                if not not_modified:
+                    async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_BYTES):
+                        await asyncio.to_thread(part_file.write, chunk)
+            size = await asyncio.to_thread(self._finish_part_file, part_file, destination, not_modified)
+        except BaseException:
+            # Shielded so the close + unlink still completes in its thread when the
+            # download itself was cancelled (or is cancelled again during cleanup).
+            await asyncio.shield(asyncio.to_thread(self._discard_part_file, part_file))
+            raise
+
+        if not_modified or not conditional:
+            return size
+        if etag:
+            self._download_etags[destination] = etag
+        else:
+            self._download_etags.pop(destination, None)
+        return size
+
+    async def _download_from_drive_item(
+        self,
+        drive_id: str,
+        item_id: str,
+        token: str,
+        destination: Path,
+        conditional: bool,
+    ) -> int:
         content_url = (
             f"{self.settings.graph_base_url}/drives/{quote(drive_id)}/items/{quote(item_id)}/content"
         )
-        return await self._download_from_url(content_url, token)
+        return await self._download_from_url(content_url, token, destination, conditional)
 
-    async def _download_using_file_url(self, token: str) -> bytes:
+    async def _download_using_file_url(self, token: str, destination: Path, conditional: bool) -> int:
         file_url = (self.settings.graph_file_url or "").strip()
         if not file_url:
             raise RuntimeError("MS_FILE_URL is not configured.")
@@ -95,10 +172,10 @@ class GraphClient:
             if match:
                 drive_id = unquote(match.group(1))
                 item_id = unquote(match.group(2))
-                return await self._download_from_drive_item(drive_id, item_id, token)
+                return await self._download_from_drive_item(drive_id, item_id, token, destination, conditional)
 
             if parsed.path.endswith("/content"):
-                return await self._download_from_url(file_url, token)
+                return await self._download_from_url(file_url, token, destination, conditional)
 
         # Treat non-Graph URLs as OneDrive/SharePoint sharing links.
         share_id = self._encode_share_url(file_url)
@@ -111,17 +188,19 @@ class GraphClient:
         if not item_id or not drive_id:
             raise RuntimeError("Unable to resolve drive item from MS_FILE_URL.")
 
-        return await self._download_from_drive_item(str(drive_id), str(item_id), token)
+        return await self._download_from_drive_item(str(drive_id), str(item_id), token, destination, conditional)
 
-    async def download_excel_file(self) -> bytes:
+    async def download_excel_file(self, destination: Path, conditional: bool = True) -> int:
+        # conditional=False always downloads and keeps no ETag for destination
+        # (used for one-off scratch files such as the health probe).
         token = await self._get_access_token()
 
         if self.settings.graph_file_url:
-            return await self._download_using_file_url(token)
+            return await self._download_using_file_url(token, destination, conditional)
 
         drive_id = self.settings.effective_drive_id
         item_id = self.settings.effective_item_id
         if drive_id and item_id:
-            return await self._download_from_drive_item(drive_id, item_id, token)
+            return await self._download_from_drive_item(drive_id, item_id, token, destination, conditional)
 
         raise RuntimeError("Graph file locator is missing. Configure MS_FILE_URL or MS_DRIVE_ID + MS_ITEM_ID.")